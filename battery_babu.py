@@ -12,11 +12,14 @@
 #
 # Deps: pip install opencv-python numpy requests python-dotenv
 
-import os, sys, cv2, time, json, logging, requests, numpy as np
+import os, sys, cv2, time, json, queue, logging, threading, requests, numpy as np
 from logging.handlers import RotatingFileHandler
+from collections import namedtuple
 from datetime import datetime
 from urllib.parse import quote
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 
 
@@ -39,6 +42,17 @@ DVR_PORT    = os.getenv("DVR_PORT", "554")
 DVR_CH      = os.getenv("DVR_CHANNEL", "1")
 DVR_ST      = os.getenv("DVR_SUBTYPE", "1")  # 0=main, 1=sub
 
+# Capture backend: "ffmpeg" (default) or "gstreamer" (drops frames in the decoder)
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "ffmpeg").lower()
+GST_DECODER     = os.getenv("GST_DECODER", "avdec_h264")
+GST_SAMPLE_FPS  = os.getenv("GST_SAMPLE_FPS", "4")
+
+# Low-latency FFmpeg RTSP options (read by OpenCV when the capture opens); .env can override
+os.environ.setdefault(
+    "OPENCV_FFMPEG_CAPTURE_OPTIONS",
+    "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay|max_delay;500000|reorder_queue_size;0|buffer_size;102400",
+)
+
 # Telegram
 BOT_TOKEN   = os.getenv("TELEGRAM_BOT_TOKEN", "")
 CHAT_ID     = os.getenv("TELEGRAM_CHAT_ID", "")
@@ -55,6 +69,7 @@ ABS_MIN_V90         = int(os.getenv("ABS_MIN_V90", "0"))  # optional floor
 
 # Relative (daylight) detection
 RING_PX             = int(os.getenv("RING_PX", "24"))
+RING_STRIDE         = int(os.getenv("RING_STRIDE", "4"))   # sample every Nth ring pixel per axis
 V_QUANTILE          = float(os.getenv("V_QUANTILE", "0.90"))
 MIN_RATIO           = float(os.getenv("MIN_RATIO", "1.35"))
 MIN_DIFF            = float(os.getenv("MIN_DIFF", "35"))
@@ -70,11 +85,14 @@ HOT_BLOB_FRAC    = float(os.getenv("HOT_BLOB_FRAC", "0.02"))
 
 # Output & files
 SAVE_FRAME_ON_ALERT = os.getenv("SAVE_FRAME_ON_ALERT", "1") == "1"
+ALERT_JPEG_QUALITY  = int(os.getenv("ALERT_JPEG_QUALITY", "70"))
+ALERT_IMAGE_SCALE   = float(os.getenv("ALERT_IMAGE_SCALE", "0.5"))
 CONFIG_FILE         = os.getenv("ROI_FILE", "lights_alert_roi.json")
 
 # Logging / resilience
 STATUS_EVERY_SEC    = int(os.getenv("STATUS_EVERY_SEC", "5"))
 STALL_TIMEOUT_SEC   = int(os.getenv("STALL_TIMEOUT_SEC", "15"))
+MAX_SAMPLE_GAP_SEC  = float(os.getenv("MAX_SAMPLE_GAP_SEC", "3"))   # most lit time one sample can add
 RECONNECT_BASE_SEC  = int(os.getenv("RECONNECT_BASE_SEC", "3"))
 RECONNECT_MAX_SEC   = int(os.getenv("RECONNECT_MAX_SEC", "30"))
 LOG_FILE            = os.getenv("LOG_FILE", "battery_babu.log")
@@ -108,6 +126,11 @@ def build_rtsp():
     """Build a safe RTSP URL (URL-encode password)."""
     return f"rtsp://{DVR_USER}:{quote(DVR_PASS)}@{DVR_IP}:{DVR_PORT}/cam/realmonitor?channel={DVR_CH}&subtype={DVR_ST}"
 
+# One keep-alive connection pool to Telegram; reused across alerts, bounded on failure
+_tg_session = requests.Session()
+_tg_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2,
+                                          max_retries=Retry(total=2, backoff_factor=0.3)))
+
 def send_telegram(msg, image=None):
     """Send a Telegram message or photo; never crash on error."""
     if not (BOT_TOKEN and CHAT_ID):
@@ -118,14 +141,53 @@ def send_telegram(msg, image=None):
             url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
             files = {"photo": ("frame.jpg", image, "image/jpeg")}
             data  = {"chat_id": CHAT_ID, "caption": msg}
-            requests.post(url, data=data, files=files, timeout=10)
+            _tg_session.post(url, data=data, files=files, timeout=10)
         else:
             url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-            requests.get(url, params={"chat_id": CHAT_ID, "text": msg}, timeout=10)
+            _tg_session.get(url, params={"chat_id": CHAT_ID, "text": msg}, timeout=10)
         logging.info("Telegram sent.")
     except Exception as e:
         logging.warning("Telegram error: %s", e)
 
+def send_alert(msg, frame=None):
+    """Downscale and encode the snapshot (if any), then send; runs on the alert worker."""
+    image = None
+    if frame is not None:
+        try:
+            if 0 < ALERT_IMAGE_SCALE < 1:
+                frame = cv2.resize(frame, None, fx=ALERT_IMAGE_SCALE, fy=ALERT_IMAGE_SCALE,
+                                   interpolation=cv2.INTER_AREA)
+            ok, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, ALERT_JPEG_QUALITY,
+                                                   cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+                                                   cv2.IMWRITE_JPEG_PROGRESSIVE, 0])
+            image = jpg.tobytes() if ok else None
+        except Exception as e:
+            logging.warning("Snapshot encode error: %s", e)
+    send_telegram(msg, image=image)
+
+# Alerts (JPEG encode + Telegram upload) go to one worker through a 1-slot queue,
+# so the monitor loop never waits on the network and a stuck upload can't pile up work
+_alert_q = queue.Queue(maxsize=1)
+
+def _alert_worker():
+    while True:
+        msg, frame = _alert_q.get()
+        try:
+            send_alert(msg, frame)
+        except Exception as e:
+            logging.warning("Alert worker error: %s", e)
+
+threading.Thread(target=_alert_worker, name="alert", daemon=True).start()
+
+def queue_alert(msg, frame=None):
+    """Hand an alert to the worker; drop it if the previous one is still pending."""
+    try:
+        _alert_q.put_nowait((msg, frame))
+        return True
+    except queue.Full:
+        logging.warning("Previous alert still sending; dropped: %s", msg)
+        return False
+
 def pick_roi(frame):
     """Let the user draw one or more boxes over the lamp(s)."""
     r = cv2.selectROIs(WINDOW_TITLE, frame, showCrosshair=True)
@@ -146,11 +208,23 @@ def validate_rois(shape, rois):
         out.append((int(x), int(y), int(x2 - x), int(y2 - y)))
     return out
 
+# (ROI file mtime, frame (H, W)) -> validated ROIs, so reconnects skip the file and a decode
+_roi_cache = (None, None)
+
+def stream_shape(cap):
+    """Frame (H, W) as reported by the capture, without decoding a frame."""
+    return int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
 def load_or_create_roi(cap):
     """Load ROI from JSON if valid, otherwise open selector and save."""
+    global _roi_cache
     if os.path.exists(CONFIG_FILE):
         try:
-            cfg  = json.load(open(CONFIG_FILE, "r"))
+            shape = stream_shape(cap)
+            if all(shape) and _roi_cache[0] == (os.path.getmtime(CONFIG_FILE), shape):
+                return _roi_cache[1]
+            with open(CONFIG_FILE, "r") as f:
+                cfg = json.load(f)
             rois = cfg.get("rois", [])
             ok, frame = cap.read()
             if not ok:
@@ -158,6 +232,7 @@ def load_or_create_roi(cap):
             rois = validate_rois(frame.shape, rois)
             if rois:
                 logging.info("Loaded ROI from %s: %s", CONFIG_FILE, rois)
+                _roi_cache = ((os.path.getmtime(CONFIG_FILE), frame.shape[:2]), rois)
                 return rois
             else:
                 logging.warning("ROI file invalid; reselecting.")
@@ -171,98 +246,259 @@ def load_or_create_roi(cap):
     if not rois:
         raise RuntimeError("Empty ROI; select at least one box.")
     try:
-        json.dump({"rois": rois}, open(CONFIG_FILE, "w"))
+        with open(CONFIG_FILE, "w") as f:
+            json.dump({"rois": rois}, f)
         logging.info("Saved ROI to %s", CONFIG_FILE)
+        _roi_cache = ((os.path.getmtime(CONFIG_FILE), frame.shape[:2]), rois)
     except Exception as e:
         logging.warning("Could not save ROI: %s", e)
     return rois
 
-def ring_mask(shape, roi, ring_px=20):
-    """Create a ring mask around an ROI (outer pad minus the ROI)."""
+def ring_mask(shape, roi, ring_px=20, out=None):
+    """Create a ring mask around an ROI (outer pad minus the ROI).
+
+    With `out`, the ring is OR-ed into that mask in place (one pass over the
+    outer box only) instead of allocating a new full-frame mask.
+    """
     H, W = shape[:2]
     x, y, w, h = roi
     x1, y1, x2, y2 = x, y, x + w, y + h
     xo1, yo1 = max(0, x1 - ring_px), max(0, y1 - ring_px)
     xo2, yo2 = min(W, x2 + ring_px), min(H, y2 + ring_px)
-    mask = np.zeros((H, W), np.uint8)
-    mask[yo1:yo2, xo1:xo2] = 1
-    mask[y1:y2, x1:x2] = 0
+    ring = np.ones((yo2 - yo1, xo2 - xo1), np.uint8)
+    ring[y1 - yo1:y2 - yo1, x1 - xo1:x2 - xo1] = 0
+    mask = np.zeros((H, W), np.uint8) if out is None else out
+    mask[yo1:yo2, xo1:xo2] |= ring
     return mask
 
-def roi_stats(frame, rois):
-    """Compute V90 (max across ROIs), global median, and hot fractions.
+def v_channel(bgr, out=None):
+    """HSV V channel of a BGR image; OpenCV defines V = max(B, G, R).
+
+    Pairwise np.maximum over the channel planes is several times faster than
+    a max reduction over axis 2, and never computes H or S.
+    """
+    v = np.maximum(bgr[..., 0], bgr[..., 1], out=out)
+    return np.maximum(v, bgr[..., 2], out=v)
+
+def quantile_ranks(n, q):
+    """Order-statistic ranks (k, k+1) and interpolation weight for quantile q of n samples."""
+    pos = q * (n - 1)
+    k = int(pos)
+    return k, min(k + 1, n - 1), pos - k
+
+def hist_select(hist, ranks):
+    """Quantile from a 256-bin V histogram at precomputed quantile_ranks()."""
+    k, k1, frac = ranks
+    lo, hi = np.searchsorted(np.cumsum(hist), (k, k1), side="right")
+    return float(lo) + (float(hi) - float(lo)) * frac
+
+def hist_quantile(hist, q):
+    """Linear-interpolated quantile (as np.quantile) from a 256-bin V histogram."""
+    return hist_select(hist, quantile_ranks(int(hist.sum()), q))
+
+# Per-ROI geometry, fixed once the ROIs are chosen: crop slices, area, V_QUANTILE
+# ranks for the crop size, and reusable V / hot-mask buffers so the per-sample
+# path does not allocate them
+RoiInfo = namedtuple("RoiInfo", "ys xs area q v hot")
+
+# Union of all ROI rings as flat pixel indices, median ranks, and gather buffers
+RingInfo = namedtuple("RingInfo", "idx q px v")
+
+def pack_rois(shape, rois):
+    """Precompute slices and buffers for each ROI."""
+    H, W = shape[:2]
+    pack = []
+    for (x, y, w, h) in rois:
+        x1, y1, x2, y2 = x, y, min(W, x + w), min(H, y + h)
+        crop = (max(0, y2 - y1), max(0, x2 - x1))
+        pack.append(RoiInfo(slice(y1, y2), slice(x1, x2), max(w * h, 1),
+                            quantile_ranks(crop[0] * crop[1], V_QUANTILE),
+                            np.empty(crop, np.uint8), np.empty(crop, bool)))
+    return pack
+
+def pack_ring(shape, rois, ring_px=20, stride=1):
+    """Build the union ring mask once and keep only its flat pixel indices.
+
+    With stride > 1 only ring pixels on a stride x stride grid are kept; the
+    median is stable under that subsampling. Falls back to every pixel if the
+    grid would leave the ring empty.
+    """
+    m = np.zeros(shape[:2], np.uint8)
+    for r in rois:
+        ring_mask(shape, r, ring_px, out=m)
+    ys, xs = np.nonzero(m[::stride, ::stride])
+    idx = ys * stride * m.shape[1] + xs * stride if ys.size else np.flatnonzero(m)
+    return RingInfo(idx, quantile_ranks(idx.size, 0.5),
+                    np.empty((idx.size, 3), np.uint8), np.empty(idx.size, np.uint8))
+
+def roi_stats(frame, roi_pack):
+    """Compute V90 (max across ROIs) and hot fractions on the ROI crops.
 
     Returns:
         v90_max:  max 90th percentile brightness among ROIs
-        V:        full V channel image
-        global_median: median V over whole frame
         hot_frac_max:  max fraction of "hot" pixels among ROIs
         hot_blob_max:  max largest hot blob area fraction among ROIs
     """
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    V = hsv[:, :, 2]
-
     v90_list, hot_frac_list, hot_blob_list = [], [], []
-    for (x, y, w, h) in rois:
-        roi = V[y:y+h, x:x+w]
+    for r in roi_pack:
+        roi = v_channel(frame[r.ys, r.xs], out=r.v)
         if roi.size == 0:
             continue
 
-        # bright core quantile
-        v90_list.append(float(np.quantile(roi, V_QUANTILE)))
-
-        # hot pixels
-        hot = (roi >= HOT_V).astype(np.uint8)
-        hot_frac_list.append(float(hot.mean()))
+        # one histogram pass gives both the bright core quantile and hot fraction
+        hist = np.bincount(roi.ravel(), minlength=256)
+        v90_list.append(hist_select(hist, r.q))
+        n_hot = int(hist[HOT_V:].sum())
+        hot_frac_list.append(float(n_hot) / roi.size)
 
-        # largest contiguous hot blob
+        # largest contiguous hot blob (none without hot pixels)
+        if not n_hot:
+            hot_blob_list.append(0.0)
+            continue
+        hot = np.greater_equal(roi, HOT_V, out=r.hot).view(np.uint8)
         try:
-            res = cv2.findContours(hot * 255, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            cnts = res[0] if len(res) == 2 else res[1]
-            max_blob = max((cv2.contourArea(c) for c in cnts), default=0.0)
-            hot_blob_list.append(float(max_blob) / float(max(w * h, 1)))
+            num, _, stats, _ = cv2.connectedComponentsWithStats(hot, connectivity=8)
+            max_blob = int(stats[1:, cv2.CC_STAT_AREA].max()) if num > 1 else 0
+            hot_blob_list.append(float(max_blob) / float(r.area))
         except Exception:
             hot_blob_list.append(0.0)
 
     v90_max       = float(max(v90_list))      if v90_list else 0.0
     hot_frac_max  = float(max(hot_frac_list)) if hot_frac_list else 0.0
     hot_blob_max  = float(max(hot_blob_list)) if hot_blob_list else 0.0
-    global_median = float(np.median(V))
 
-    return v90_max, V, global_median, hot_frac_max, hot_blob_max
+    return v90_max, hot_frac_max, hot_blob_max
+
+def global_median(frame):
+    """Median V over a 1/8-scale decimated thumbnail of the whole frame."""
+    H, W = frame.shape[:2]
+    thumb = cv2.resize(frame, (max(1, W // 8), max(1, H // 8)), interpolation=cv2.INTER_NEAREST)
+    return hist_quantile(np.bincount(v_channel(thumb).ravel(), minlength=256), 0.5)
 
-def bg_from_rings(V, shape, rois, ring_px=20):
-    """Median V over the union of ring masks around all ROIs."""
-    masks = [ring_mask(shape, r, ring_px) for r in rois]
-    if not masks:
+def bg_from_rings(frame, ring):
+    """Median V over the union of ring masks around all ROIs (one gather)."""
+    if not ring.idx.size:
         return 0.0
-    m = np.clip(np.sum(masks, axis=0), 0, 1).astype(bool)
-    vals = V[m]
-    return float(np.median(vals)) if vals.size else 0.0
+    px = np.take(frame.reshape(-1, 3), ring.idx, axis=0, out=ring.px)
+    # exact median by selection on the 256-bin histogram; no sort or partition
+    return hist_select(np.bincount(v_channel(px, out=ring.v), minlength=256), ring.q)
+
+def build_gst_pipeline(url):
+    """GStreamer pipeline that decodes and rate-limits to GST_SAMPLE_FPS before appsink."""
+    return (
+        f"rtspsrc location={url} latency=200 drop-on-latency=true ! "
+        f"rtph264depay ! h264parse ! {GST_DECODER} ! "
+        f"videorate ! video/x-raw,framerate={GST_SAMPLE_FPS}/1 ! "
+        "videoconvert ! video/x-raw,format=BGR ! "
+        "appsink drop=true max-buffers=1 sync=false"
+    )
 
 def open_stream(url):
     """Open RTSP stream with small buffer to reduce latency."""
     log_url = url.replace(DVR_PASS, "***") if DVR_PASS else url
+    if CAPTURE_BACKEND == "gstreamer":
+        logging.info("Opening RTSP via GStreamer (%s @ %s fps): %s", GST_DECODER, GST_SAMPLE_FPS, log_url)
+        cap = cv2.VideoCapture(build_gst_pipeline(url), cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            return cap
+        logging.warning("GStreamer pipeline failed (OpenCV built without GStreamer?); falling back to FFmpeg.")
     logging.info("Opening RTSP: %s", log_url)
-    cap = cv2.VideoCapture(url)
+    cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
     try:
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
     except Exception:
         pass
     return cap
 
+class FrameGrabber:
+    """Drain the stream on a background thread; decode only sampled frames.
+
+    Every frame is grab()bed so the socket never backs up, but only every
+    `sample_every`-th one is retrieve()d into BGR. The newest sampled frame
+    sits in a single slot (older ones are dropped, not queued). The thread
+    owns the capture and releases it when stopped.
+
+    Decoded frames are retrieve()d into recycled buffers: a dropped frame or
+    the one handed out by the previous read() goes back to the pool, so a
+    returned frame is only valid until the next read() (copy it to keep it).
+    """
+
+    def __init__(self, cap, sample_every):
+        self.cap = cap
+        self.sample_every = max(1, sample_every)
+        self.cond = threading.Condition()
+        self.frame = None
+        self.held = None    # frame lent to the caller by the last read()
+        self.spare = []     # recycled frame buffers
+        self.grabbed = 0
+        self.last_good = time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="FrameGrabber", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        try:
+            while self.running:
+                if not self.cap.grab():
+                    time.sleep(0.05)
+                    continue
+                # sample grabs 0, N, 2N, ...: the first frame after (re)connect is analysed at once
+                frame = None
+                if self.grabbed % self.sample_every == 0:
+                    with self.cond:
+                        buf = self.spare.pop() if self.spare else None
+                    ok, frame = self.cap.retrieve(buf)
+                    if not ok:
+                        frame = None
+                        if buf is not None:
+                            with self.cond:
+                                self.spare.append(buf)
+                with self.cond:
+                    self.grabbed += 1
+                    self.last_good = time.monotonic()
+                    if frame is not None:
+                        if self.frame is not None:
+                            self.spare.append(self.frame)
+                        self.frame = frame
+                        self.cond.notify_all()
+        except Exception as e:
+            logging.warning("Grabber error: %s", e)
+        finally:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+
+    def read(self, timeout=1.0):
+        """Wait for the next sampled frame; None on timeout or once the grabber has stopped."""
+        with self.cond:
+            if self.held is not None:
+                self.spare.append(self.held)
+            self.cond.wait_for(lambda: self.frame is not None or not self.running, timeout)
+            frame, self.frame = self.frame, None
+            self.held = frame
+        return frame
+
+    def stop(self):
+        self.running = False
+
 # ------------------- Main monitor loop -------------------
 def monitor():
     rtsp = build_rtsp()
     backoff = RECONNECT_BASE_SEC
     last_status = time.monotonic()
-    last_good   = time.monotonic()
-    last_alert  = 0.0
+    last_alert  = float("-inf")
     lights_on_accum = 0.0
-    base_dark = None
-    frame_idx = 0
+    base_dark = None    # ambient baseline; seeded from the first sample's background
+    learn_below = max(ABS_THRESH - 10, 0)   # V90 below this => lamp likely off
+    # ROI/ring geometry survives reconnects; rebuilt only if the ROIs or frame size change
+    roi_pack = ring = packed_for = None
 
     while True:
+        cap = grabber = None
         try:
             cap = open_stream(rtsp)
             if not cap.isOpened():
@@ -279,46 +515,57 @@ def monitor():
                 time.sleep(3)
                 continue
 
+            # GStreamer already drops frames in the decoder; sample everything it delivers
+            sample_every = 1 if cap.getBackendName() == "GSTREAMER" else FRAME_SAMPLE_EVERY
+
+            # declared FPS (status line only) is fixed per connection; query it before the grabber owns the capture
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            fps = fps if fps and fps > 0 else 10
+
             logging.info("Monitoring... alert_after=%ss, cooldown=%ss", ALERT_AFTER_SEC, COOLDOWN_SEC)
             backoff = RECONNECT_BASE_SEC
-            last_status = last_good = time.monotonic()
-            frame_idx = 0
+            last_status = time.monotonic()
+            grabber = FrameGrabber(cap, sample_every)
+            prev_sample = None
 
             while True:
-                ok, frame = cap.read()
-                if not ok or frame is None:
-                    if time.monotonic() - last_good > STALL_TIMEOUT_SEC:
+                frame = grabber.read()
+                now = time.monotonic()
+                if frame is None:
+                    if not grabber.running:
+                        logging.warning("Stream reader exited. Reconnecting...")
+                        break
+                    if now - grabber.last_good > STALL_TIMEOUT_SEC:
                         logging.warning("Stream stalled > %ss. Reconnecting...", STALL_TIMEOUT_SEC)
                         break
-                    time.sleep(0.05)
-                    continue
-
-                last_good = time.monotonic()
-                frame_idx += 1
-
-                # heartbeat while skipping to keep connection fresh
-                if frame_idx % FRAME_SAMPLE_EVERY:
-                    if time.monotonic() - last_status >= STATUS_EVERY_SEC:
-                        logging.info("Heartbeat: processed=%d, waiting for sample...", frame_idx)
-                        last_status = time.monotonic()
                     continue
+                # measured time since the previous sample (DVRs often misreport FPS, so it
+                # is not used here); the first sample of a connection adds nothing, and a
+                # wall-clock cap keeps a pause in delivery from counting as lit time
+                step = 0.0 if prev_sample is None else min(now - prev_sample, MAX_SAMPLE_GAP_SEC)
+                prev_sample = now
 
                 try:
                     # --- feature computation ---
-                    v90, V, global_med, hot_frac, hot_blob_frac = roi_stats(frame, rois)
-                    v_bg = bg_from_rings(V, frame.shape, rois, RING_PX)
+                    if packed_for != (frame.shape, rois):
+                        roi_pack = pack_rois(frame.shape, rois)
+                        ring = pack_ring(frame.shape, rois, RING_PX, max(1, RING_STRIDE))
+                        packed_for = (frame.shape, rois)
+                    v90, hot_frac, hot_blob_frac = roi_stats(frame, roi_pack)
+                    v_bg = bg_from_rings(frame, ring)
 
                     # learn ambient baseline from background (lamp likely off)
                     if base_dark is None:
                         base_dark = v_bg
-                    if v90 < max(ABS_THRESH - 10, 0):
-                        base_dark = 0.95 * (base_dark or v_bg) + 0.05 * v_bg
+                    elif v90 < learn_below:
+                        base_dark = 0.95 * base_dark + 0.05 * v_bg
 
-                    dyn_abs_thr = max(ABS_THRESH, (base_dark or 0) + DELTA_OVER_BASE)
+                    dyn_abs_thr = max(ABS_THRESH, base_dark + DELTA_OVER_BASE)
                     abs_ok = (v90 >= dyn_abs_thr) and (v90 >= ABS_MIN_V90)
 
-                    # relative rule gated to daylight
-                    is_day = (global_med >= RELATIVE_DAY_MIN_GLOBAL) and (v_bg >= BG_MIN_FOR_REL)
+                    # relative rule gated to daylight (cheap ring check first; the
+                    # frame-wide median is only needed when the ring is bright)
+                    is_day = (v_bg >= BG_MIN_FOR_REL) and (global_median(frame) >= RELATIVE_DAY_MIN_GLOBAL)
                     ratio  = (v90 / max(v_bg, 1.0))
                     diff   = (v90 - v_bg)
                     rel_ok = is_day and ((ratio >= MIN_RATIO) or (diff >= MIN_DIFF))
@@ -334,64 +581,53 @@ def monitor():
                         lights_on = abs_ok and hot_ok
 
                     # timing accumulation
-                    fps = cap.get(cv2.CAP_PROP_FPS)
-                    fps = fps if fps and fps > 0 else 10
-                    dt  = FRAME_SAMPLE_EVERY / fps
-                    lights_on_accum = lights_on_accum + dt if lights_on else 0.0
+                    lights_on_accum = lights_on_accum + step if lights_on else 0.0
 
                     # status line
-                    if time.monotonic() - last_status >= STATUS_EVERY_SEC:
+                    if now - last_status >= STATUS_EVERY_SEC:
                         logging.info(
-                            "State=%s | V90=%.0f bg=%.0f | ratio=%.2f>=%.2f diff=%.0f>=%.0f | abs_thr=%.0f | hot=%.2f/%.2f | day=%s | accum=%.1fs | fps=%.1f | frames=%d",
+                            "State=%s | V90=%.0f bg=%.0f | ratio=%.2f>=%.2f diff=%.0f>=%.0f | abs_thr=%.0f | hot=%.2f/%.2f | day=%s | accum=%.1fs | fps=%.1f | frames=%d | proc=%.1fms/%.0fms",
                             "ON " if lights_on else "off", v90, v_bg, ratio, MIN_RATIO, diff, MIN_DIFF,
                             dyn_abs_thr, hot_frac, hot_blob_frac, str(is_day),
-                            lights_on_accum, fps, frame_idx
+                            lights_on_accum, fps, grabber.grabbed,
+                            (time.monotonic() - now) * 1000, step * 1000
                         )
-                        last_status = time.monotonic()
+                        last_status = now
 
                     # alert logic
-                    now = time.time()
                     if lights_on_accum >= ALERT_AFTER_SEC and now - last_alert >= COOLDOWN_SEC:
                         ts  = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
                         msg = f"⚡ Battery Babu: Lights look ON for more than {int(lights_on_accum)}s @ {ts}"
-                        if SAVE_FRAME_ON_ALERT:
-                            try:
-                                ok2, jpg = cv2.imencode(".jpg", frame)
-                                send_telegram(msg, image=jpg.tobytes() if ok2 else None)
-                            except Exception as e:
-                                logging.warning("Snapshot encode/send error: %s", e)
-                                send_telegram(msg)
-                        else:
-                            send_telegram(msg)
-                        logging.info("Alert sent; cooldown %ss.", COOLDOWN_SEC)
+                        if queue_alert(msg, frame.copy() if SAVE_FRAME_ON_ALERT else None):
+                            logging.info("Alert queued; cooldown %ss.", COOLDOWN_SEC)
                         last_alert = now
                         lights_on_accum = 0.0
 
-                    time.sleep(0.01)
-
                 except Exception as e:
                     logging.error("Processing error: %s", e)
                     time.sleep(0.2)
                     continue
 
             # reconnect path
-            try:
-                cap.release()
-            except Exception:
-                pass
+            grabber.stop()
             logging.info("Reconnecting in %ss...", backoff)
             time.sleep(backoff)
             backoff = min(RECONNECT_MAX_SEC, max(RECONNECT_BASE_SEC, backoff * 2))
 
         except KeyboardInterrupt:
             logging.info("KeyboardInterrupt: exiting.")
-            try:
-                cap.release()
-            except Exception:
-                pass
+            if grabber is not None:
+                grabber.stop()
+            elif cap is not None:
+                try:
+                    cap.release()
+                except Exception:
+                    pass
             break
         except Exception as e:
             logging.error("Top-level error: %s", e)
+            if grabber is not None:
+                grabber.stop()
             time.sleep(backoff)
             backoff = min(RECONNECT_MAX_SEC, max(RECONNECT_BASE_SEC, backoff * 2))
 